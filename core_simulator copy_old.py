@@ -102,29 +102,41 @@
 '''
 
 from collections import deque
+from itertools import permutations
 import random
 
-INDICES = [0, 1, 2, 3]
+ORDERINGS = tuple(permutations([0, 1, 2, 3]))	# every order in which a core can visit its four lines
+LOG = []	# (message, arguments) recorded during simulation and formatted afterwards
+TILE = 8	# cores per side of the blocks in which the mesh is swept
 
 class Packet:
+	__slots__ = ('value', 'dx', 'dy', 'ready_at', 'name')
 	id = 1
 
 	def __init__(self, value, dx, dy):
 		self.value = value
 		self.dx = dx
 		self.dy = dy
-		self.hops = 0	# metrics
-		self.delays = 0	# metrics
-		self.routing_delay = 0
+		self.ready_at = 0	# timestep at which the packet may leave its current line or core
 		self.name = Packet.id
 		Packet.id += 1
 
 class Hardware:
+	__slots__ = ('default_routing_delay',)
+
 	def __init__(self):
 		self.default_routing_delay = 0	# default to no processing time
 
 class Core(Hardware):
+	__slots__ = ('lines', 'send_buffer', 'wait_buffer', 'name', 'packet_out_buffer', 'merge_delay')
 	id = 1
+	# line index to send a packet on, indexed by [sign(dx) + 1][sign(dy) + 1]
+	# x is routed before y; None means the packet has reached its destination
+	DIRECTIONS = (
+		(2, 2, 2),		# dx < 0: west
+		(3, None, 0),	# dx == 0: south, here, north
+		(1, 1, 1),		# dx > 0: east
+	)
 
 	def __init__(self, north_line, east_line, west_line, south_line):
 		self.lines = [north_line, east_line, west_line, south_line]
@@ -136,80 +148,64 @@ class Core(Hardware):
 		self.merge_delay = 2
 		Core.id += 1
 
-	def route(self):
+	def route(self, t):
 		'''	Route a packet, either taken directly from the send buffer, or taken
 			from the wait buffer (provided nothing's been queued in the send buffer)
 		'''
-		to_remove = []
-
+		# idle cores have nothing to route, and their packet_out registers
+		# were already reset at the end of the last call
+		if not self.send_buffer and not self.wait_buffer:
+			return
 		# send buffer has higher priority than wait buffer
 		# add unroutable packets back to the buffer
-		new_buffer = deque()
-		while len(self.send_buffer) > 0:
+		# both buffers are rotated in place: each packet present at the start
+		# of the call is popped once and survivors are pushed back on the end
+		for x in range(0, len(self.send_buffer)):
 			packet = self.forward(self.send_buffer.popleft())
-			if packet:
-				new_buffer.append(packet)
-		self.send_buffer = new_buffer
+			if packet is not None:
+				self.send_buffer.append(packet)
 
-		for packet in self.wait_buffer:
-			if packet.routing_delay > 0:
-				packet.routing_delay -= 1
+		for x in range(0, len(self.wait_buffer)):
+			packet = self.wait_buffer.popleft()
+			if packet.ready_at > t:
+				self.wait_buffer.append(packet)
 			else:
-				print("Packet " + str(packet.name) + " is at core " + str(self.name) + " and must travel " + str(packet.dx) + " cores in the x and " + str(packet.dy) + " cores in the y")
-				to_remove.append(packet)
+				LOG.append(("Packet %d is at core %d and must travel %d cores in the x and %d cores in the y", (packet.name, self.name, packet.dx, packet.dy)))
 				blocked_packet = self.forward(packet)
-				if blocked_packet:
+				if blocked_packet is not None:
 					self.send_buffer.append(blocked_packet)
 
-		for packet in to_remove:
-			self.wait_buffer.remove(packet)
-
+		# offload and reset the registers in place rather than allocating a
+		# fresh list for every core on every timestep
+		lines = self.lines
+		packet_out_buffer = self.packet_out_buffer
 		for x in range(0, 4):
-			if self.lines[x] and self.packet_out_buffer[x]:
-				self.lines[x].inject(self.packet_out_buffer[x])
-
-		self.packet_out_buffer = [None, None, None, None]
+			packet = packet_out_buffer[x]
+			if packet is not None:
+				if lines[x] is not None:
+					lines[x].inject(packet, t)
+				packet_out_buffer[x] = None
 
 	def forward(self, packet):
 		''' Adds packets to the appropriate directional output if possible
 			Returns packets that it cannot route at the present time
 		'''
-		if packet.dx > 0:	# send east
-			if not self.lines[1]:
-				print("Packet " + str(packet.name) + " was lost")
-				return None 	# destroy packets that attempt to go off the edge
-			if not self.lines[1].packet and not self.packet_out_buffer[1]:
-				self.packet_out_buffer[1] = packet
-				return None
-		elif packet.dx < 0:	# send west
-			if not self.lines[2]:
-				print("Packet " + str(packet.name) + " was lost")
-				return None 	# destroy packets that attempt to go off the edge
-			if not self.lines[2].packet and not self.packet_out_buffer[2]:
-				self.packet_out_buffer[2] = packet
-				return None
-		elif packet.dy > 0:	# send north
-			if not self.lines[0]:
-				print("Packet " + str(packet.name) + " was lost")
-				return None 	# destroy packets that attempt to go off the edge
-			if not self.lines[0].packet and not self.packet_out_buffer[0]:
-				self.packet_out_buffer[0] = packet
-				return None
-		elif packet.dy < 0: # send south
-			if not self.lines[3]:
-				print("Packet " + str(packet.name) + " was lost")
-				return None 	# destroy packets that attempt to go off the edge
-			if not self.lines[3].packet and not self.packet_out_buffer[3]:
-				self.packet_out_buffer[3] = packet
-				return None
-		else:
+		x = Core.DIRECTIONS[(packet.dx > 0) - (packet.dx < 0) + 1][(packet.dy > 0) - (packet.dy < 0) + 1]
+		if x is None:
 			# Destroy packet
-			print("Packet " + str(packet.name) + " has reached its destination")
+			LOG.append(("Packet %d has reached its destination", (packet.name,)))
+			return None
+		line = self.lines[x]
+		if line is None:
+			LOG.append(("Packet %d was lost", (packet.name,)))
+			return None 	# destroy packets that attempt to go off the edge
+		if line.packet is None and self.packet_out_buffer[x] is None:
+			self.packet_out_buffer[x] = packet
 			return None
 		return packet
 
 
-	def pickup(self):
+	def pickup(self, t):
 		''' Grab new packets from connected lines, but only if they're headed in
 			a direction that this core can help with (i.e. continue sending to
 			the north if packet came from the south, but a core should do nothing
@@ -227,15 +223,14 @@ class Core(Hardware):
 			y-direction, no merging routes exist for packets heading East/West.
 
 		'''
-		random.shuffle(INDICES)
-		for x in INDICES:
+		for x in ORDERINGS[random.randrange(len(ORDERINGS))]:
 			line = self.lines[x]
-			if line and line.packet and line.packet.routing_delay == 0 and \
+			if line is not None and line.packet is not None and line.packet.ready_at <= t and \
 					((line.packet.dx > 0 and x == 2) or \
 					(line.packet.dx < 0 and x == 1)  or \
 					(line.packet.dy > 0 and x == 3) or \
 					(line.packet.dy < 0 and x == 0)):
-				line.packet.routing_delay = self.default_routing_delay
+				line.packet.ready_at = t + self.default_routing_delay
 				if x == 2:
 					line.packet.dx -= 1
 				elif x == 1:
@@ -249,6 +244,7 @@ class Core(Hardware):
 
 
 class Line(Hardware):
+	__slots__ = ('packet', 'name', 'component_1', 'component_2')
 	id = 1
 
 	def __init__(self):
@@ -259,82 +255,91 @@ class Line(Hardware):
 		self.component_1 = None
 		self.component_2 = None
 
-	def inject(self, packet):
+	def inject(self, packet, t):
 		self.packet = packet
-		self.packet.routing_delay = self.default_routing_delay
+		self.packet.ready_at = t + self.default_routing_delay
 
 	def connect(self, terminus_1, terminus_2):
 		self.component_1 = terminus_1
 		self.component_2 = terminus_2
 
-	def route(self):
-		if self.packet:
-			if self.packet.routing_delay > 0:
-				self.packet.routing_delay -= 1
+def print_log():
+	for message, args in LOG:
+		print(message % args)
 
 def simulate(core_array, timesteps):
 	'''	Make each component perform its duty per timestamp
-		for each wire:
-			if contains a packet:
-				decrement delay by one time unit
 		for each core:
 			extra_delay = 0
 			for each wire, selected randomly:
-				if wire contains a packet:
+				if wire contains a packet whose wire delay has expired:
 					if core can help route packet:
 						add to queue with extra_delay
 						increment extra_delay
 		for each core:
-			decrement all stall timers for waiting packets
 			for each packet in the send buffer:
 				add to directional packet_out register if register is empty
-			for each packet in the wait buffer:
+			for each packet in the wait buffer whose stall has expired:
 				add to directional packet_out register if register is empty
 			offload packet_out registers to adjacent wires
 			reset all packet_out registers
 
-		These three steps need to be computed discretely for each core because
+		Delays are stored as the timestep at which they expire, so neither
+		wires nor wait buffers need a per-timestep countdown.
+
+		These two steps need to be computed discretely for each core because
 		otherwise, for a given core c, whether a wire w is cleared before a
 		new packet is injected into w is a function of when c is visited.
 	'''
+	cores = tile_order(core_array)
 	for t in range(0, timesteps):
-		print("t = " + str(t))
-		visited = {}
-		for x in range(0, len(core_array)):
-			for y in range(0, len(core_array[0])):
-				core = core_array[x][y]
-				for line in core.lines:
-					if line and not visited.get(line):
-						line.route()
-						visited[line] = True
-		for x in range(0, len(core_array)):
-			for y in range(0, len(core_array[0])):
-				core = core_array[x][y]
-				core.pickup()
-		for x in range(0, len(core_array)):
-			for y in range(0, len(core_array[0])):
-				core = core_array[x][y]
-				core.route()
-
-core_array = []
-size = 16
-for y in range(0, size):
+		LOG.append(("t = %d", (t,)))
+		for core in cores:
+			core.pickup(t)
+		for core in cores:
+			core.route(t)
+
+def tile_order(core_array):
+	'''	Order the cores block by block so that neighbouring cores, and the
+		lines they share, are visited close together rather than a whole
+		row apart on large meshes
+	'''
 	cores = []
-	east_line = None
-	west_line = None
-	for x in range(0, size):
-		south_line = None if y == size - 1 else Line()
-		north_line = None if y == 0 else core_array[y - 1][x].lines[3]
-		east_line = Line() if x < size - 1 else None
-		cores.append(Core(north_line, east_line, west_line, south_line))
-		west_line = east_line
-	core_array.append(cores)
-
-for x in range(0, size - 1):
-	for y in range(0, size - 1):
-		# all lines now "know" connected cores
-		core_array[x][y].lines[1].connect(core_array[x][y], core_array[x + 1][y])
-		core_array[x][y].lines[3].connect(core_array[x][y], core_array[x][y + 1])
+	height = len(core_array)
+	width = len(core_array[0])
+	for tile_y in range(0, height, TILE):
+		for tile_x in range(0, width, TILE):
+			for y in range(tile_y, min(tile_y + TILE, height)):
+				for x in range(tile_x, min(tile_x + TILE, width)):
+					cores.append(core_array[y][x])
+	return cores
+
+def construct_mesh(size):
+	'''	Build the mesh in a single row-major pass. Each core creates its own
+		east and south lines and reuses the lines already created by its
+		west and north neighbours, so every line can be connected as soon as
+		the core at its far end exists.
+	'''
+	core_array = []
+	for y in range(0, size):
+		cores = []
+		west_line = None
+		for x in range(0, size):
+			south_line = None if y == size - 1 else Line()
+			north_line = None if y == 0 else core_array[y - 1][x].lines[3]
+			east_line = Line() if x < size - 1 else None
+			core = Core(north_line, east_line, west_line, south_line)
+			# all lines now "know" connected cores
+			if north_line:
+				north_line.connect(core_array[y - 1][x], core)
+			if west_line:
+				west_line.connect(cores[x - 1], core)
+			cores.append(core)
+			west_line = east_line
+		core_array.append(cores)
+	return core_array
+
+core_array = construct_mesh(16)
 
  # These packets intersect at core 1, 1 and neither gets delayed because their routing pipelines do not overlap
 core_array[0][1].send_buffer.append(Packet(1, 0, -5))
@@ -360,3 +365,4 @@ core_array[9][10].send_buffer.append(Packet(1, 0, -5))
 core_array[15][14].send_buffer.append(Packet(1, 5, -5))
 
 simulate(core_array, 200)
+print_log()
@@ -12,10 +12,10 @@
 	training.
 
 	In this update, neurons are instantiated at the head of the net--that is,
-	via the codify_pixels method, they are able to translate data from the
-	2D spatial domain to the frequency domain. Sixteen neurons are distributed
-	across the training data so as to capture groups of 81 pixels each
-	(two pixels of overlap on every border).
+	via codify_pixels, they are able to translate data from the 2D spatial
+	domain to the frequency domain. Sixteen neurons, held together in a
+	NeuronPopulation, are distributed across the training data so as to capture
+	groups of 81 pixels each (two pixels of overlap on every border).
 
 	The spiking frequency of immediately connected neurons is determined by
 	summing across each of the zones. Image are normalized before conversion
@@ -25,10 +25,16 @@
 '''
 
 import numpy as np
-from mnist import MNIST
+from numpy.lib.stride_tricks import sliding_window_view
 
 LEAK = 0.1
 
+def codify_pixels(arr):
+	''' Sum the intensity of a patch of pixels, scaled to a spiking frequency
+		Sums over the last two axes, so a stack of patches gives one frequency each
+	'''
+	return np.asarray(arr).sum(axis=(-2, -1)) * 1000
+
 class Neuron:
 	def __init__(self, threshold, parent, child):
 		self.parents = parent
@@ -43,40 +49,62 @@ class Neuron:
 		self.membrane_potential += weight
 
 	def codify_pixels(self, arr):
-		intensity = 0
-		for x in range(0, len(arr)):
-			for y in range(0, len(arr[0])):
-				intensity += arr[x][y]
-		intensity *= 1000
-		return intensity
-
-
-data = MNIST('./dataset')
-
-x_train, y_train = data.load_training()
-x_test, y_test = data.load_testing()
-
-
-x_train = x_train / np.linalg.norm(x_train)
-
-y_train = np.asarray(y_train).astype(np.int32)
-x_test = np.asarray(x_test).astype(np.float32)
-y_test = np.asarray(y_test).astype(np.int32)
-
-five = np.reshape(x_train[0], (28, 28))
-#print(five)
-
-neurons = []
-frequencies = []
-for x in range(0, 4):
-	neurons.append([])
-	frequencies.append([])
-	for y in range(0, 4):
-		neurons[x].append(Neuron(0, None, None))
-		min_x = max(0, (x * 7) - 1)
-		max_x = min(28, ((x + 1) * 7) + 1)
-		min_y = max(0, (y * 7) - 1)
-		max_y = min(28, ((y + 1) * 7) + 1)
-		frequencies[x].append(neurons[x][y].codify_pixels(five[min_x:max_x,min_y:max_y]))
-for row in frequencies:
-	print(row)
\ No newline at end of file
+		return float(codify_pixels(arr))
+
+class NeuronPopulation:
+	''' The input layer: one neuron per zone of a square grid laid over a 28x28 image
+		Membrane potentials and thresholds are kept in arrays so that the whole
+		population leaks, is stimulated, and fires in one operation
+	'''
+	def __init__(self, threshold, grid = 4):
+		self.grid = grid
+		n_neurons = grid * grid
+		self.membrane_potential = np.zeros(n_neurons, dtype=np.float32)
+		self.threshold = np.full(n_neurons, threshold, dtype=np.float32)
+
+	def leak(self):
+		self.membrane_potential -= LEAK
+
+	def stimulate(self, weights):
+		self.membrane_potential += weights
+
+	def spiking(self):
+		return self.membrane_potential > self.threshold
+
+	def codify_pixels(self, image):
+		''' Frequency of each neuron's zone, flattened row by row
+			Zones are square tiles grown by one pixel on every side; padding the
+			image by one pixel turns them into windows two pixels wider than
+			the tile, spaced one tile apart
+			The grid must tile the image exactly, so that every pixel falls in a
+			zone and there is one zone per neuron
+		'''
+		if len(image) % self.grid:
+			raise ValueError("a %dx%d grid does not tile a %d-pixel image" % (self.grid, self.grid, len(image)))
+		tile = len(image) // self.grid
+		zones = sliding_window_view(np.pad(image, 1), (tile + 2, tile + 2))[::tile, ::tile]
+		return codify_pixels(zones[:self.grid, :self.grid]).ravel()
+
+if __name__ == "__main__":
+	from mnist import MNIST
+
+	data = MNIST('./dataset')
+
+	x_train, y_train = data.load_training()
+	x_test, y_test = data.load_testing()
+
+
+	x_train = np.asarray(x_train, dtype=np.float32).reshape(-1, 28, 28)
+	x_train /= np.linalg.norm(x_train)
+
+	y_train = np.asarray(y_train).astype(np.int32)
+	x_test = np.asarray(x_test).astype(np.float32)
+	y_test = np.asarray(y_test).astype(np.int32)
+
+	five = x_train[0]
+	#print(five)
+
+	neurons = NeuronPopulation(0)
+	frequencies = neurons.codify_pixels(five)
+	for row in frequencies.reshape(neurons.grid, neurons.grid):
+		print(row)
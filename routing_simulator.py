@@ -31,9 +31,11 @@
 	of Integrated Circuits and Systems, 34 (10), 2015.
 '''
 
-import queue
+from collections import deque
 
 class Packet:
+	__slots__ = ('value', 'dx', 'dy', 'hops', 'gate_delays')
+
 	def __init__(self, value, dx, dy):
 		self.value = value
 		self.dx = dx
@@ -51,134 +53,140 @@ class ForwardWest:
 		self.comparator_x = Comparator(self.buffer.line_out, 'dx', 'zero')
 		self.adder = ArithmeticUnit(self.comparator_x.false_out, 'dx', 'increment')
 		self.comparator_y = Comparator(self.comparator_x.true_out, 'dy', 'negative')
-		self.all_components = {self.local_source_component, self.east_source_component, self.merge_in, self.buffer, self.comparator_x, self.adder, self.comparator_y}
+		self.names = {self.adder.line_out: "west", self.comparator_y.true_out: "south", self.comparator_y.false_out: "north"}
+		# downstream components go first, so each one takes its input before the
+		# one feeding it produces the next: a packet moves one stage per tick,
+		# and the timing no longer depends on set iteration order
+		self.all_components = [self.comparator_y, self.adder, self.comparator_x, self.buffer, self.merge_in, self.east_source_component, self.local_source_component]
 
 	def outputs(self):
 		return [self.adder.line_out, self.comparator_y.true_out, self.comparator_y.false_out]
 		#		West 			 	 South						 North
 
 	def direction(self, output):
-		self.names = {self.adder.line_out: "west", self.comparator_y.true_out: "south", self.comparator_y.false_out: "north"}
 		return self.names[output]
 
 class Component:
+	__slots__ = ('line_in', 'line_out', 'backlog')
+
 	# Useful for dummy components
 	def __init__(self):
 		self.line_in = Line(None)
 		self.line_out = Line(self)
-		self.backlog = queue.Queue()
+		self.backlog = deque()
 
 	def stall(self, packet):
-		self.backlog.put(packet)
+		self.backlog.append(packet)
 
 	# To be called in actual simulation
 	def safe_execute(self):
-		if self.backlog.empty():
-			if self.line_in.packet:
+		if not self.backlog:
+			if self.line_in.packet is not None:
 				self.execute(self.line_in.packet)
 				self.line_in.delete_packet()
 		else:
-			self.backlog.put(self.line_in.packet)
-			self.execute(self.backlog.get())
+			self.backlog.append(self.line_in.packet)
+			self.execute(self.backlog.popleft())
 
 	def execute(self, packet):
 		pass
 
 class Buffer(Component):
+	__slots__ = ()
+
 	def __init__(self, line_in):
 		self.line_in = line_in
 		self.line_out = Line(self)
-		self.backlog = queue.Queue()
+		self.backlog = deque()
 
 	def execute(self, packet):
 		self.line_out.inject(packet)
 
 class Comparator(Component):
+	# test applied to a packet, looked up by (direction, kind)
+	TESTS = {
+		('dx', 'zero'): lambda packet: packet.dx == 0,
+		('dy', 'zero'): lambda packet: packet.dy == 0,
+		('dx', 'negative'): lambda packet: packet.dx < 0,
+		('dy', 'negative'): lambda packet: packet.dy < 0,
+	}
+	__slots__ = ('true_out', 'false_out', 'direction', 'kind', 'test')
+
 	def __init__(self, line_in, direction, kind):
 		self.line_in = line_in
 		self.true_out = Line(self)
 		self.false_out = Line(self)
 		self.direction = direction
 		self.kind = kind
+		self.test = Comparator.TESTS[(direction, kind)]
 		self.line_out = None
-		self.backlog = queue.Queue()
+		self.backlog = deque()
 
 	def execute(self, packet):
-		if packet:
-			if self.kind == 'zero':
-				if self.direction == 'dx':
-					if packet.dx == 0:
-						self.true_out.inject(packet)
-					else:
-						self.false_out.inject(packet)
-				else:
-					if packet.dy == 0:
-						self.true_out.inject(packet)
-					else:
-						self.false_out.inject(packet)
+		if packet is not None:
+			if self.test(packet):
+				self.true_out.inject(packet)
 			else:
-				if self.direction == 'dx':
-					if packet.dx < 0:
-						self.true_out.inject(packet)
-					else:
-						self.false_out.inject(packet)
-				else:
-					if packet.dy < 0:
-						self.true_out.inject(packet)
-					else:
-						self.false_out.inject(packet)
+				self.false_out.inject(packet)
 
 class ArithmeticUnit(Component):
+	__slots__ = ('direction', 'kind', 'step')
+
 	def __init__(self, line_in, direction, kind):
 		self.line_in = line_in
 		self.line_out = Line(self)
 		self.direction = direction
 		self.kind = kind
-		self.backlog = queue.Queue()
+		self.step = 1 if kind == 'increment' else -1
+		self.backlog = deque()
 
 	def execute(self, packet):
-		if packet:
+		if packet is not None:
 			if self.direction == 'dx':
-				packet.dx += 1 if self.kind == 'increment' else -1
+				packet.dx += self.step
 			else:
-				packet.dy += 1 if self.kind == 'increment' else -1
+				packet.dy += self.step
 			self.line_out.inject(packet)
 
 class Merger(Component):
+	__slots__ = ('line_in_1', 'line_in_2')
+
 	def __init__(self, line_in_1, line_in_2):
 		self.line_in_1 = line_in_1
 		self.line_in_2 = line_in_2
 		self.line_out = Line(self)
 		self.line_in = None
-		self.backlog = queue.Queue()
+		self.backlog = deque()
 
 	# Overridden because mergers take two inputs
 	def safe_execute(self):
-		if self.backlog.empty():
-			if self.line_in_1.packet:
+		if not self.backlog:
+			if self.line_in_1.packet is not None:
 				self.execute(self.line_in_1.packet)
 				self.line_in_1.delete_packet()
-			if self.line_in_2.packet:
+			if self.line_in_2.packet is not None:
 				self.execute(self.line_in_2.packet)
 				self.line_in_2.delete_packet()
 		else:
-			if self.line_in_1.packet:
-				self.backlog.put(self.line_in_1.packet)
-			if self.line_in_2.packet:
-				self.backlog.put(self.line_in_2.packet)
-			self.execute(self.backlog.get())	# Assuming high-throughput
-			self.execute(self.backlog.get())
+			if self.line_in_1.packet is not None:
+				self.backlog.append(self.line_in_1.packet)
+			if self.line_in_2.packet is not None:
+				self.backlog.append(self.line_in_2.packet)
+			self.execute(self.backlog.popleft())	# Assuming high-throughput
+			self.execute(self.backlog.popleft())
 
 	def execute(self, packet):
 		self.line_out.inject(packet)
 
 class Line:
+	__slots__ = ('component_in', 'packet')
+
 	def __init__(self, component_in):
 		self.component_in = component_in
 		self.packet = None
 
 	def inject(self, packet):
-		if packet and self.packet:
+		if packet is not None and self.packet is not None:
 			self.component_in.stall(packet)
 		else:
 			self.packet = packet
@@ -195,35 +203,20 @@ def simulate(model):
 	fin = False
 	while not fin:
 		next_config(model)
-		for x in range (0, len(model.outputs())):
-			if outputs[x].packet is not None:
-				print("Packet has arrived and is destined for rerouting due " + model.direction(outputs[x]))
+		for output in outputs:
+			if output.packet is not None:
+				print("Packet has arrived and is destined for rerouting due " + model.direction(output))
 				fin = True
 				break
 
-# Test 1: still heading West! (Authors prioritized east/west movement over north/south)
-component_1 = Component()
-component_2 = Component()
-packet = Packet("Test", -3, -5)
-component_1.line_out.inject(packet)
-fw = ForwardWest(component_1, component_2)
-simulate(fw)
-
-# Test 2: still heading West!
-packet = Packet("Test", -3, 5)
-component_1.line_out.inject(packet)
-fw = ForwardWest(component_1, component_2)
-simulate(fw)
-
-# Test 3: done moving laterally, now have to go North
-packet = Packet("Test", 0, 5)
-component_1.line_out.inject(packet)
-fw = ForwardWest(component_1, component_2)
-simulate(fw)
-
-#Test 4: done moving laterally, now have to go South
-packet = Packet("Test", 0, -5)
-component_1.line_out.inject(packet)
-fw = ForwardWest(component_1, component_2)
-simulate(fw)
-
+tests = [
+	(-3, -5),	# Test 1: still heading West! (Authors prioritized east/west movement over north/south)
+	(-3, 5),	# Test 2: still heading West!
+	(0, 5),		# Test 3: done moving laterally, now have to go North
+	(0, -5),	# Test 4: done moving laterally, now have to go South
+]
+for dx, dy in tests:
+	component_1 = Component()
+	component_2 = Component()
+	component_1.line_out.inject(Packet("Test", dx, dy))
+	simulate(ForwardWest(component_1, component_2))
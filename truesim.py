@@ -269,17 +269,46 @@
 '''
 
 from collections import deque
+import heapq
+import logging
+import math
 import random
 import argparse
 
+log = logging.getLogger(__name__)
+TRACE = False	# report individual packet events; enabled with --trace
+
 N_CHANNELS = 1
+STALE_AGE = 1500	# ticks a packet may stay in flight before it is considered stale
 packetlist = []
+event_queue = []	# (delivery tick, packet name, packet) for packets in transit on a line
+active_cores = {}	# cores currently holding at least one packet, in order of activation
 activated_neurons = {}
 #propagated_activity = {}
 
+# packet directions, numbered to match the order of Core.lines_in/lines_out
+NORTH = 0
+EAST = 1
+WEST = 2
+SOUTH = 3
+UP = 4
+DOWN = 5
+LOCAL = 6	# the packet has arrived at its destination core
+EXIT = 8	# set once the packet has cleared its last forwarding unit in a core
+
+# change in (dx, dy, dz) as a packet crosses a line in each direction
+HOP = (
+	(0, -1, 0),	# north
+	(-1, 0, 0),	# east
+	(1, 0, 0),	# west
+	(0, 1, 0),	# south
+	(0, 0, -1),	# up
+	(0, 0, 1),	# down
+)
+
 class Packet:
+	__slots__ = ('dx', 'dy', 'dz', 'ready_at', 'name', 'parent', 'directionality', 'birth', 'death', 'target')
 	id = 1
-	delays = 0
 
 	def __init__(self, parent, dx, dy, dz = 0):
 		'''	dx: + means go right (increase y value)
@@ -289,24 +318,38 @@ class Packet:
 		self.dx = dx
 		self.dy = dy
 		self.dz = dz
-		self.routing_delay = 0
+		self.ready_at = 0	# tick from which the packet may move on from its core
 		self.name = Packet.id
 		self.parent = parent
 		self.directionality = self.determine_directionality()
-		self.ready_to_send = False
-		self.alive_for = 0
+		self.birth = 0	# tick at which the packet entered the network
+		self.death = None	# tick at which the packet reached its destination
 		self.target = None
 		Packet.id += 1
 
+	def heading(self):
+		'''	Direction of the packet's next hop, or LOCAL once it has arrived
+			Priority: x, then y, then z
+		'''
+		if self.dx > 0:
+			return EAST
+		if self.dx < 0:
+			return WEST
+		if self.dy > 0:
+			return NORTH
+		if self.dy < 0:
+			return SOUTH
+		if self.dz > 0:
+			return UP
+		if self.dz < 0:
+			return DOWN
+		return LOCAL
+
 	def determine_directionality(self):
-		'''	Priority: x, then y, then z
+		'''	Forwarding unit a new packet enters its source core through
 		'''
-		directionality = "upbound" if self.dz > 0 else "downbound"
-		directionality = "southbound" if self.dy < 0 else directionality
-		directionality = "northbound" if self.dy > 0 else directionality
-		directionality = "eastbound" if self.dx > 0 else directionality
-		directionality = "westbound" if self.dx < 0 else directionality
-		return directionality
+		heading = self.heading()
+		return DOWN if heading == LOCAL else heading	# packets addressed to their own core leave via forward-down
 
 	def give_target_neuron(self, target):
 		self.target = target
@@ -345,7 +388,7 @@ class Neuron:
 		#global propagated_activity
 		#if propagated_activity.get(self):
 		#	print("Neuron in layer " + str(self.layer) + " has spiked")
-		if self.target:
+		if self.target is not None:
 			dx = self.target.core.y - self.core.y
 			dy = self.core.x - self.target.core.x
 			dz = -(self.target.core.z - self.core.z)
@@ -355,56 +398,25 @@ class Neuron:
 		return None
 
 class Hardware:
-	def __init__(self):
-		self.default_routing_delay = 0	# default to no processing time
+	__slots__ = ('default_routing_delay',)
 
-class Buffer:
 	def __init__(self):
-		self.out = [None for x in range(0, N_CHANNELS)]
-
-	def is_clear(self):
-		for x in range(0, N_CHANNELS):
-			if self.out[x] == None:
-				return True
-		return False
-
-	def add(self, packet):
-		for x in range(0, N_CHANNELS):
-			if self.out[x] == None:
-				self.out[x] = packet
-				break
-		#self._count_capacity()
-
-	def _count_capacity(self):
-		count = 0
-		for packet in self.out:
-			if packet != None:
-				count += 1
-		print("Buffer contains " + str(count) + " packets")
-
-	def clear(self):
-		for x in range(0, N_CHANNELS):
-			self.out[x] = None
-
-	def flush(self):
-		packets = []
-		for packet in self.out:
-			if packet != None:
-				packets.append(packet)
-		self.clear()
-		return packets
+		self.default_routing_delay = 0	# default to no processing time
 
 class Core(Hardware):
+	__slots__ = ('lines_in', 'lines_out', 'send_buffer', 'wait_buffer', 'name', 'packet_out_buffer',
+			'forward_north_merge', 'forward_east_merge', 'forward_south_merge', 'forward_west_merge',
+			'forward_up_merge', 'forward_down_merge', 'neurons', 'x', 'y', 'z', 'delays')
 	id = 1
 
 	def __init__(self, x, y, z, n1, n2, e1, e2, w1, w2, s1, s2, u1 = None, u2 = None, d1 = None, d2 = None):
-		self.lines_in = [n1, e1, w1, s1, u1, d1]
-		self.lines_out = [n2, e2, w2, s2, u2, d2]
+		self.lines_in = (n1, e1, w1, s1, u1, d1)	# fixed by the topology, indexed by direction code
+		self.lines_out = (n2, e2, w2, s2, u2, d2)
 		self.default_routing_delay = 2 # overhead of bundling and unbundling: page 1547
 		self.send_buffer = deque()	# used if cannot inject a packet to a transmission line
 		self.wait_buffer = deque()	# used to stall so that default routing delay ticks to 0
 		self.name = Core.id
-		self.packet_out_buffer = [Buffer() for x in range(0, 6)]
+		self.packet_out_buffer = [None, None, None, None, None, None]	# one outbound register per direction
 		self.forward_north_merge = None
 		self.forward_east_merge = None
 		self.forward_south_merge = None
@@ -415,211 +427,182 @@ class Core(Hardware):
 		self.x = x
 		self.y = y
 		self.z = z
+		self.delays = 0	# ticks lost by packets in this core to congestion
 		Core.id += 1
 
-	def inject(self, packet):
-		packet.routing_delay = self.default_routing_delay
+	def inject(self, packet, ctick):
+		packet.ready_at = ctick + self.default_routing_delay
 		packet.parent = self
 		self.wait_buffer.append(packet)
+		active_cores[self] = True
 
 	def append_neuron(self, neuron):
 		self.neurons.append(neuron)
 
-	def route(self):
+	def is_idle(self):
+		'''	True once every packet has left the core's buffers
+		'''
+		if self.send_buffer or self.wait_buffer:
+			return False
+		for packet in self.packet_out_buffer:
+			if packet is not None:
+				return False
+		return True
+
+	def route(self, ctick):
 		'''	Prepare a packet for sendoff, either taken directly from the send buffer, or taken
 			from the wait buffer (provided nothing's been queued in the send buffer)
 			Packets should have an average transit time/core of ~11.5 centiticks
 				11 - 1 (for wire) = 10 - (2 * 2) (for entry/exit overhead) = 6
 				Might have to turn the corner, increasing average
 		'''
+		# cores that are only draining their packet_out buffers have nothing
+		# to route; the merges are already clear from the last call
+		if not self.send_buffer and not self.wait_buffer:
+			return
 		# send buffer has higher priority than wait buffer
 		# add unroutable packets back to the buffer
-		new_wait_buffer = deque()
-		new_buffer = deque()
-		while len(self.send_buffer) > 0:
-			packet = self.forward(self.send_buffer.popleft())
-			if packet:
-				new_buffer.append(packet)
-		self.send_buffer = new_buffer
-
-		for packet in self.wait_buffer:
-			if packet.routing_delay > 0:
-				packet.routing_delay -= 1
-				new_wait_buffer.append(packet)
+		# both buffers are rotated in place: each packet present at the start
+		# of the call is popped once and survivors are pushed back on the end
+		for x in range(0, len(self.send_buffer)):
+			packet = self.forward(self.send_buffer.popleft(), ctick)
+			if packet is not None:
+				self.send_buffer.append(packet)
+
+		for x in range(0, len(self.wait_buffer)):
+			packet = self.wait_buffer.popleft()
+			if packet.ready_at > ctick:
+				self.wait_buffer.append(packet)
 			else:
-				packet, is_outbound = self.advance(packet)	# send to next internal component
+				packet, is_outbound = self.advance(packet, ctick)	# send to next internal component
 				if is_outbound:
 					#print("Packet " + str(packet.name) + " is at core " + str(self.name) + " and dx = " + str(packet.dx) + ", dy = " + str(packet.dy) + ", dz = " + str(packet.dz))
-					blocked_packet = self.forward(packet)
-					if blocked_packet:
-						Packet.delays += 1
+					blocked_packet = self.forward(packet, ctick)
+					if blocked_packet is not None:
+						self.delays += 1
 						self.send_buffer.append(blocked_packet)
 				else:
-					new_wait_buffer.append(packet)
-		self.wait_buffer = new_wait_buffer
+					self.wait_buffer.append(packet)
 
-		self.clear_merges()
+		# free the forwarding units for the next tick
+		self.forward_north_merge = self.forward_east_merge = self.forward_south_merge = \
+			self.forward_west_merge = self.forward_up_merge = self.forward_down_merge = None
 
-	def advance(self, packet):
+	def advance(self, packet, ctick):
 		''' Responsible for forwarding a packet through a given routing subsystem
 		'''
 		is_outbound = False
-		if "exit" in packet.directionality:
+		if packet.directionality & EXIT:
 			return (packet, True)
-		packet.routing_delay = 6
-		if packet.directionality == 'eastbound':
-			if self.forward_east_merge == None:
+		packet.ready_at = ctick + 7	# held by the forwarding unit for the next six ticks
+		if packet.directionality == EAST:
+			if self.forward_east_merge is None:
 				self.forward_east_merge = packet
 				if packet.dx != 0:
-					packet.directionality = 'east-exit'
+					packet.directionality = EAST | EXIT
 				elif packet.dy > 0:
-					packet.directionality = 'north'
+					packet.directionality = NORTH
 				else:
-					packet.directionality = 'south'	# route exits and up/downs through forward-south
+					packet.directionality = SOUTH	# route exits and up/downs through forward-south
 			else:
-				packet.routing_delay = 0	# unsuccessful routes can be immediately reattempted
-				Packet.delays += 1
-		elif packet.directionality == 'westbound':
-			if self.forward_west_merge == None:
+				packet.ready_at = ctick + 1	# unsuccessful routes can be immediately reattempted
+				self.delays += 1
+		elif packet.directionality == WEST:
+			if self.forward_west_merge is None:
 				self.forward_west_merge = packet
 				if packet.dx != 0:
-					packet.directionality = 'west-exit'
+					packet.directionality = WEST | EXIT
 				elif packet.dy > 0:
-					packet.directionality = 'north'
+					packet.directionality = NORTH
 				else:
-					packet.directionality = 'south'
+					packet.directionality = SOUTH
 			else:
-				packet.routing_delay = 0
-				Packet.delays += 1
-		elif "south" in packet.directionality:	# accept both southbound packets and packets turning the corner
-			if self.forward_south_merge == None:
+				packet.ready_at = ctick + 1
+				self.delays += 1
+		elif packet.directionality == SOUTH:	# accept both southbound packets and packets turning the corner
+			if self.forward_south_merge is None:
 				self.forward_south_merge = packet
 				if packet.dy != 0:
-					packet.directionality = 'south-exit'
+					packet.directionality = SOUTH | EXIT
 				elif packet.dz > 0:
-					packet.directionality = 'up'
+					packet.directionality = UP
 				elif packet.dz < 0:
-					packet.directionality = 'down'
+					packet.directionality = DOWN
 				else:
-					packet.directionality = 'self-exit'
+					packet.directionality = LOCAL | EXIT
 			else:
-				packet.routing_delay = 0
-				Packet.delays += 1
-		elif "north" in packet.directionality:	# accept both northbound packets and packets turning the corner
-			if self.forward_north_merge == None:
+				packet.ready_at = ctick + 1
+				self.delays += 1
+		elif packet.directionality == NORTH:	# accept both northbound packets and packets turning the corner
+			if self.forward_north_merge is None:
 				self.forward_north_merge = packet
 				if packet.dy != 0:
-					packet.directionality = 'north-exit'
+					packet.directionality = NORTH | EXIT
 				elif packet.dz > 0:
-					packet.directionality = 'up'
+					packet.directionality = UP
 				elif packet.dz < 0:
-					packet.directionality = 'down'
+					packet.directionality = DOWN
 				else:
-					packet.directionality = 'self-exit'
+					packet.directionality = LOCAL | EXIT
 			else:
-				packet.routing_delay = 0
-				Packet.delays += 1
-		elif "up" in packet.directionality:	# accept both southbound packets and packets turning the corner
-			if self.forward_up_merge == None:
+				packet.ready_at = ctick + 1
+				self.delays += 1
+		elif packet.directionality == UP:	# accept both upbound packets and packets turning the corner
+			if self.forward_up_merge is None:
 				self.forward_up_merge = packet
-				packet.directionality = 'up-exit'
+				packet.directionality = UP | EXIT
 			else:
-				packet.routing_delay = 0
-				Packet.delays += 1
-		elif "down" in packet.directionality:	# accept both northbound packets and packets turning the corner
-			if self.forward_down_merge == None:
+				packet.ready_at = ctick + 1
+				self.delays += 1
+		elif packet.directionality == DOWN:	# accept both downbound packets and packets turning the corner
+			if self.forward_down_merge is None:
 				self.forward_down_merge = packet
-				packet.directionality = 'down-exit'
+				packet.directionality = DOWN | EXIT
 			else:
-				packet.routing_delay = 0
-				Packet.delays += 1
+				packet.ready_at = ctick + 1
+				self.delays += 1
 		return (packet, is_outbound)
 
-	def clear_merges(self):
-		self.forward_north_merge = None
-		self.forward_east_merge = None
-		self.forward_south_merge = None
-		self.forward_west_merge = None
-		self.forward_up_merge = None
-		self.forward_down_merge = None
-
-	def send_out(self):
-		for x in range(0, len(self.lines_out)):
-			if self.lines_out[x]:
-				packets = self.packet_out_buffer[x].flush()
-				for packet in packets:
-					blocked_packet = self.lines_out[x].inject(packet)
-					if blocked_packet != None:	# add packet back in if it was blocked
-						Packet.delays += 1
-						self.packet_out_buffer[x].add(blocked_packet)
-
-	def forward(self, packet):
+	def send_out(self, ctick):
+		lines_out = self.lines_out
+		packet_out_buffer = self.packet_out_buffer
+		for x in range(0, 6):
+			packet = packet_out_buffer[x]
+			if packet is not None:	# only ever set for directions that have a line
+				blocked_packet = lines_out[x].inject(packet, ctick)
+				packet_out_buffer[x] = blocked_packet	# keep the packet in the register if it was blocked
+				if blocked_packet is not None:
+					self.delays += 1
+
+	def forward(self, packet, ctick):
 		''' Adds packets to the appropriate directional output if possible
 			Returns packets that it cannot route at the present time
 		'''
 		#print("forwarding packet #" + str(packet.name))
-		if packet.dx > 0:	# send east
-			if not self.lines_out[1]:
-				print("Packet " + str(packet.name) + " was lost")
-				packet.parent = None
-				return None 	# destroy packets that attempt to go off the edge
-			if self.lines_out[1].is_clear() and self.packet_out_buffer[1].is_clear():
-				self.packet_out_buffer[1].add(packet)
-				return None
-		elif packet.dx < 0:	# send west
-			if not self.lines_out[2]:
-				print("Packet " + str(packet.name) + " was lost")
-				packet.parent = None
-				return None 	# destroy packets that attempt to go off the edge
-			if self.lines_out[2].is_clear() and self.packet_out_buffer[2].is_clear():
-				self.packet_out_buffer[2].add(packet)
-				return None
-		elif packet.dy > 0:	# send north
-			if not self.lines_out[0]:
-				print("Packet " + str(packet.name) + " was lost")
-				packet.parent = None
-				return None 	# destroy packets that attempt to go off the edge
-			if self.lines_out[0].is_clear() and self.packet_out_buffer[0].is_clear():
-				self.packet_out_buffer[0].add(packet)
-				return None
-		elif packet.dy < 0: # send south
-			if not self.lines_out[3]:
-				print("Packet " + str(packet.name) + " was lost")
-				packet.parent = None
-				return None 	# destroy packets that attempt to go off the edge
-			if self.lines_out[3].is_clear() and self.packet_out_buffer[3].is_clear():
-				self.packet_out_buffer[3].add(packet)
-				return None
-		elif packet.dz > 0:	# send up
-			if not self.lines_out[4]:
-				print("Packet " + str(packet.name) + " was lost")
-				packet.parent = None
-				return None 	# destroy packets that attempt to go off the edge
-			if self.lines_out[4].is_clear() and self.packet_out_buffer[4].is_clear():
-				self.packet_out_buffer[4].add(packet)
-				return None
-		elif packet.dz < 0: # send down
-			if not self.lines_out[5]:
-				print("Packet " + str(packet.name) + " was lost")
-				packet.parent = None
-				return None 	# destroy packets that attempt to go off the edge
-			if self.lines_out[5].is_clear() and self.packet_out_buffer[5].is_clear():
-				self.packet_out_buffer[5].add(packet)
-				return None
-		else:
+		x = packet.heading()
+		if x == LOCAL:
 			# Destroy packet
 			#print("Packet " + str(packet.name) + " has reached its destination")
 			#print(packet.target)
 			self.propagate_spike(packet.target)
 			packet.parent = None
-			packetlist.remove(packet)
+			packet.death = ctick
+			return None
+		line = self.lines_out[x]
+		if line is None:
+			if TRACE:
+				log.debug("Packet %d was lost", packet.name)
+			packet.parent = None
+			return None 	# destroy packets that attempt to go off the edge
+		if line.is_clear() and self.packet_out_buffer[x] is None:
+			self.packet_out_buffer[x] = packet
 			return None
 		return packet
 
 	def propagate_spike(self, target_neuron):
 		global packetlist
 		global activated_neurons
-		if target_neuron:	# packet made it to the right destination! (Only active under faithful workload)
+		if target_neuron is not None:	# packet made it to the right destination! (Only active under faithful workload)
 			random_val = random.random()
 			if random_val < target_neuron.probability * 5:	# downstream neurons have greater probability of triggering a firing event
 				target_neuron.spike()
@@ -631,6 +614,7 @@ class Line(Hardware):
 	''' Bandwidth.
 			One wire in/one wire out for each direction. N_CHANNELS = 1
 	'''
+	__slots__ = ('name', 'component_in', 'component_out', 'channels')
 	id = 1
 
 	def __init__(self):
@@ -643,19 +627,21 @@ class Line(Hardware):
 
 	def is_clear(self):
 		for channel in self.channels:
-			if channel == None:
+			if channel is None:
 				return True
 		return False
 
-	def inject(self, packet):
-		'''	Inject packet into one of the open channels
+	def inject(self, packet, ctick):
+		'''	Inject packet into one of the open channels and schedule its
+			arrival at the far end of the line
 			Return the packet if it cannot be injected
 		'''
-		for channel in self.channels:
-			if channel == None:
-				channel = packet
+		channels = self.channels
+		for x in range(0, N_CHANNELS):
+			if channels[x] is None:
+				channels[x] = packet
 				packet.parent = self
-				packet.routing_delay = self.default_routing_delay
+				heapq.heappush(event_queue, (ctick + self.default_routing_delay, packet.name, packet))
 				return None
 		return packet
 
@@ -669,49 +655,58 @@ class Line(Hardware):
 	def dissassociate(self, packet):
 		''' Clear the channel of the packet for future routing
 		'''
-		for channel in self.channels:
-			if channel == packet:
-				channel = None
+		channels = self.channels
+		for x in range(0, N_CHANNELS):
+			if channels[x] is packet:
+				channels[x] = None
+				return
 
 def simulate(workload, timesteps, probability, width, topology, topology_type, mean_distance, n_layers, n_neurons):
 	'''	Make each component perform its duty per timestamp
-		for each packet:
-			decrement delay by one time unit
-		to_visit = []
-		for each packet:
-			if packet.parent_component is a line and delay == 0:
-				if packet.dx > 0:
-					add packet to component_2's wait buffer
-				elif packet.dx < 0:
-					add packet to component_1's wait buffer
-				elif packet.dy > 0:
-					add packet to component_1's wait buffer
-				elif packet.dy < 0:
-					add packet to component_2's wait buffer
-				set packet wait time
-			if packet.parent_component is a core and packet.parent_component is
-						not in to_visit:
-				append packet.parent_component to to_visit
-		for each core in to_visit:
+		for each packet whose line delay expires at t, in order of injection:
+			if packet.dx > 0:
+				add packet to component_2's wait buffer
+			elif packet.dx < 0:
+				add packet to component_1's wait buffer
+			elif packet.dy > 0:
+				add packet to component_1's wait buffer
+			elif packet.dy < 0:
+				add packet to component_2's wait buffer
+			set packet wait time
+			mark the receiving core as active
+		for each active core:
 				for each packet in the send buffer:
 					add to directional packet_out register if register is empty
 							else return to send buffer
 				for each packet in the wait buffer:
 					add to directional packet_out register if register is empty
 							else send to send buffer
-		for each core in to_visit, selected randomly:
+		for each active core:
 			for each packet in the packet_out_buffer:
 				offload packet to corresponding wire
-				packet.parent_component.packet_out_buffer[packet] = wire
+				schedule packet's arrival at t + wire delay
+			retire the core if it no longer holds any packets
 
-		These four steps need to be computed discretely for each core because
+		Packets in transit are kept in a priority queue keyed by the tick at
+		which they reach the end of their wire, so only packets that actually
+		change state at t are touched, rather than every packet in flight.
+
+		These steps need to be computed discretely for each core because
 		otherwise, for a given core c, whether a wire w is cleared before a
-		new packet is injected into w is a function of when c is to_visit.
+		new packet is injected into w is a function of when c is visited.
 	'''
 	global packetlist
+	global event_queue
+	global active_cores
 	distance = 0
-	stale_packets = {}
+	stale_packets = 0
 	input_neurons = []
+	event_queue = []
+	active_cores = {}
+	# the timestep loop below only sees these as locals
+	queue = event_queue
+	heappop = heapq.heappop
+	hop = HOP
 
 	if workload == "toy" and topology_type == 'mesh':
 		packetlist = toy_run(topology)
@@ -724,54 +719,59 @@ def simulate(workload, timesteps, probability, width, topology, topology_type, m
 			#print(t)
 
 		# two dynamic workloads update packetlist here
+		new_packets = []
 		if workload == 'random':
-			new_packets, new_distance = random_firestorm(topology, topology_type, probability, width, mean_distance)	# add in new batch of packets
-			packetlist += new_packets
+			new_packets, new_distance = random_firestorm(topology, topology_type, probability, width, mean_distance, t)	# add in new batch of packets
 			distance += new_distance
 		elif workload == 'faithful':
-			new_packets, new_distance = quasi_SNN_firestorm(input_neurons, t)
-			packetlist += new_packets
+			new_packets, new_distance = quasi_SNN_firestorm(input_neurons, probability, t)
 			distance += new_distance
-
-		for packet in packetlist:
-			packet.alive_for += 1
-			if packet.alive_for > 1500:
-				stale_packets[packet.name] = True
-			if isinstance(packet.parent, Line):
-				packet.routing_delay = max(0, packet.routing_delay - 1)
-		to_visit = []
-		for packet in packetlist:
-			if isinstance(packet.parent, Line) and packet.routing_delay == 0:
-				packet.parent.dissassociate(packet)
-				if packet.dx > 0 and packet.parent.component_out:
-					packet.dx -= 1
-					packet.directionality = 'eastbound'
-				elif packet.dx < 0 and packet.parent.component_out:
-					packet.dx += 1
-					packet.directionality = 'westbound'
-				elif packet.dy > 0 and packet.parent.component_out:
-					packet.dy -= 1
-					packet.directionality = 'northbound'
-				elif packet.dy < 0 and packet.parent.component_out:
-					packet.dy += 1
-					packet.directionality = 'southbound'
-				elif packet.dz > 0 and packet.parent.component_out:
-					packet.dz -= 1
-					packet.directionality = 'upbound'
-				elif packet.dz < 0 and packet.parent.component_out:
-					packet.dz += 1
-					packet.directionality = 'downbound'
-				if packet.parent.component_out:
-					packet.parent.component_out.inject(packet)
-			if isinstance(packet.parent, Core) and packet.parent not in to_visit:
-				to_visit.append(packet.parent)
+		for packet in new_packets:
+			packet.birth = t
+		packetlist += new_packets
+
+		while queue and queue[0][0] <= t:
+			packet = heappop(queue)[2]
+			line = packet.parent
+			line.dissassociate(packet)
+			# a packet only leaves a core with its direction | EXIT, and
+			# enters the next one through the same forwarding unit
+			direction = packet.directionality ^ EXIT
+			ddx, ddy, ddz = hop[direction]
+			packet.dx += ddx
+			packet.dy += ddy
+			packet.dz += ddz
+			packet.directionality = direction
+			line.component_out.inject(packet, t)
+		to_visit = list(active_cores)
 		for core in to_visit:
-			core.route()
-		random.shuffle(to_visit)
+			core.route(t)
+		# every line has exactly one sending core (its component_in), so the
+		# order of the send_out sweep cannot change which packets get onto a
+		# line; no need to shuffle to_visit here
 		for core in to_visit:
-			core.send_out()
+			core.send_out(t)
+			if core.is_idle():
+				del active_cores[core]
+	for packet in packetlist:
+		last_tick = packet.death if packet.death is not None else timesteps - 1
+		if last_tick - packet.birth + 1 > STALE_AGE:
+			stale_packets += 1
 	print("Total distance traveled: " + str(distance))
-	print("Total number of stale packets: " + str(len(stale_packets)))
+	delays = 0
+	for core in all_cores(topology):
+		delays += core.delays
+	print("Total number of stale packets: " + str(stale_packets))
+	print("Total number of packet delays: " + str(delays))
+
+def all_cores(topology):
+	''' Yield every core of a mesh, however deeply it is nested
+	'''
+	if isinstance(topology, Core):
+		yield topology
+	else:
+		for part in topology:
+			yield from all_cores(part)
 
 def construct_mesh(n_cores):
 	width = round(n_cores ** (1 / 2))
@@ -856,7 +856,7 @@ def toy_run(core_array):
 	packets.append(Packet(core_array[0][10], 0, 5))
 
 	for packet in packets:
-		packet.parent.inject(packet)
+		packet.parent.inject(packet, 0)
 	return packets
 
 def toy_run3D(mesh):
@@ -868,59 +868,83 @@ def toy_run3D(mesh):
 	packets.append(Packet(mesh[5][5][5], random.randint(-3, 4), random.randint(-3, 4), random.randint(-3, 4)))
 
 	for packet in packets:
-		packet.parent.inject(packet)
+		packet.parent.inject(packet, 0)
 	return packets
 
-def random_firestorm(topology, topology_type, probability, width, mean_distance):
+def firing_neurons(n_neurons, probability):
+	''' Yield, in increasing order, the indices of the neurons out of n_neurons
+		that fire when each fires independently with p = probability
+		The gap to the next firing neuron is drawn from a geometric distribution,
+		so the cost is in the number of neurons that fire rather than n_neurons
+		Gaps are compared as floats before rounding, since at vanishingly small
+		probabilities they can exceed any int, or be infinite
+	'''
+	if probability <= 0:
+		return
+	if probability >= 1:
+		yield from range(0, n_neurons)
+		return
+	log_q = math.log1p(-probability)
+	index = -1
+	while True:
+		gap = math.log(1 - random.random()) / log_q
+		if gap >= n_neurons - 1 - index:	# next firing neuron is past the last one
+			return
+		index += 1 + int(gap)
+		yield index
+
+def random_firestorm(topology, topology_type, probability, width, mean_distance, ctick):
 	''' Generate packets for each neuron with p = probability and address them
 		to valid cores such that, on average, the mean_distance value roughly
 		approximates mean distance traveled by each packet in each direction
+		Neurons are numbered core by core (x, then y, then z), 256 to a core
 	'''
 	packets = []
 	total_distance = 0
+	reach = mean_distance * 2
+	cell = -1
 	if topology_type == '3Dmesh':
-		for x in range(0, width):
-			for y in range(0, width):
-				for z in range(0, width):
-					for n in range(0, 256):
-						r_val = random.random()
-						if r_val < probability:
-							min_x = max(0, -mean_distance * 2 + y) - y
-							max_x = min(width - 1, y + (mean_distance * 2)) - y
-							max_y = min(width - 1, mean_distance * 2 + x) - x
-							min_y = max(0, x - (mean_distance * 2)) - x
-							min_z = max(-(width - 1 - z), -mean_distance * 2)
-							max_z = min(mean_distance * 2, z)
-							x_val = random.randint(min_x, max_x)
-							y_val = random.randint(-max_y, -min_y)
-							z_val = random.randint(min_z, max_z)
-							packet = Packet(topology[x][y][z], x_val, y_val, z_val)
-							packets.append(packet)
-							#print(packet.name, ":", x, y, z, min_z, max_z, width, x_val, y_val, z_val)
-							total_distance += abs(x_val)
-							total_distance += abs(y_val)
-							total_distance += abs(z_val)
+		for index in firing_neurons(width * width * width * 256, probability):
+			if index // 256 != cell:	# the bounds only depend on the core
+				cell = index // 256
+				x, y, z = cell // (width * width), cell // width % width, cell % width
+				core = topology[x][y][z]
+				min_x = max(0, -reach + y) - y
+				max_x = min(width - 1, y + reach) - y
+				max_y = min(width - 1, reach + x) - x
+				min_y = max(0, x - reach) - x
+				min_z = max(-(width - 1 - z), -reach)
+				max_z = min(reach, z)
+			x_val = random.randint(min_x, max_x)
+			y_val = random.randint(-max_y, -min_y)
+			z_val = random.randint(min_z, max_z)
+			packet = Packet(core, x_val, y_val, z_val)
+			packets.append(packet)
+			#print(packet.name, ":", x, y, z, min_z, max_z, width, x_val, y_val, z_val)
+			total_distance += abs(x_val)
+			total_distance += abs(y_val)
+			total_distance += abs(z_val)
 	elif topology_type == 'mesh':
-		for x in range(0, width):
-			for y in range(0, width):
-				for n in range(0, 256):
-					r_val = random.random()
-					if r_val < probability:
-						min_x = max(0, -mean_distance * 2 + y) - y
-						max_x = min(width - 1, y + (mean_distance * 2)) - y
-						max_y = min(width - 1, mean_distance * 2 + x) - x
-						min_y = max(0, x - (mean_distance * 2)) - x
-						x_val = random.randint(min_x, max_x)
-						y_val = random.randint(-max_y, -min_y)
-						packet = Packet(topology[x][y], x_val, y_val)
-						packets.append(packet)
-						#packet = Packet(topology[x][y], random.randint(-mean_distance * 2, mean_distance * 2), random.randint(-mean_distance * 2, mean_distance * 2))
-						#packets.append(packet)
-						total_distance += abs(x_val)
-						total_distance += abs(y_val)
+		for index in firing_neurons(width * width * 256, probability):
+			if index // 256 != cell:
+				cell = index // 256
+				x, y = cell // width, cell % width
+				core = topology[x][y]
+				min_x = max(0, -reach + y) - y
+				max_x = min(width - 1, y + reach) - y
+				max_y = min(width - 1, reach + x) - x
+				min_y = max(0, x - reach) - x
+			x_val = random.randint(min_x, max_x)
+			y_val = random.randint(-max_y, -min_y)
+			packet = Packet(core, x_val, y_val)
+			packets.append(packet)
+			#packet = Packet(topology[x][y], random.randint(-mean_distance * 2, mean_distance * 2), random.randint(-mean_distance * 2, mean_distance * 2))
+			#packets.append(packet)
+			total_distance += abs(x_val)
+			total_distance += abs(y_val)
 
 	for packet in packets:
-		packet.parent.inject(packet)
+		packet.parent.inject(packet, ctick)
 	return (packets, total_distance)
 
 def init_quasi_SNN_firestorm(topology, probability, n_layers, n_neurons):
@@ -961,18 +985,20 @@ def init_quasi_SNN_firestorm(topology, probability, n_layers, n_neurons):
 			neuron.add_target(target)
 	return layer_to_neuron[1]	# return the first layer of neurons, used to initiate spiking
 
-def quasi_SNN_firestorm(input_neurons, ctick):
+def quasi_SNN_firestorm(input_neurons, probability, ctick):
 	''' Initiate new firing chains by sending off packets from the input layer
+		Each input neuron starts a chain with p = probability
 	'''
 	packets = []
 	global activated_neurons
-	for neuron in input_neurons:
-		if random.random() < neuron.probability:
-			neuron.spike()
-			activated_neurons[neuron] = True
+	# only the input neurons that fire this tick need to be drawn
+	for index in firing_neurons(len(input_neurons), probability):
+		neuron = input_neurons[index]
+		neuron.spike()
+		activated_neurons[neuron] = True
 	for neuron in activated_neurons:
 		new_packet = neuron.is_generating_packet(ctick)
-		if new_packet:
+		if new_packet is not None:
 			new_packet.give_target_neuron(neuron.target)
 			packets.append(new_packet)
 
@@ -981,7 +1007,7 @@ def quasi_SNN_firestorm(input_neurons, ctick):
 		total_distance += abs(packet.dx)
 		total_distance += abs(packet.dy)
 		total_distance += abs(packet.dz)
-		packet.parent.inject(packet)
+		packet.parent.inject(packet, ctick)
 	return (packets, total_distance)
 
 if __name__ == "__main__":
@@ -994,7 +1020,11 @@ if __name__ == "__main__":
 	parser.add_argument('--n_layers', type=int, dest='n_layers', default=4)
 	parser.add_argument('--distance', type=int, dest='mean_distance', default=1)	# gives distance an average packet will have to travel in each direction
 	parser.add_argument('--probability', type=float, dest='probability', default=0.0001)	# gives probability that a given neuron will fire in random workload
+	parser.add_argument('--trace', action='store_true', dest='trace')	# print individual packet events
 	args = parser.parse_args()
+	if args.trace:
+		TRACE = True
+		logging.basicConfig(level=logging.DEBUG, format='%(message)s')
 	topology_type = args.topology_type
 	workload = args.workload
 	n_cores = args.n_cores
@@ -1012,7 +1042,6 @@ if __name__ == "__main__":
 		topology = construct_3D_mesh(n_cores)
 		width = round(n_cores ** (1 / 3))
 	simulate(workload, time, probability, width, topology, topology_type, mean_distance, n_layers, n_neurons)
-	print("Total number of packet delays: " + str(Packet.delays))
 
 
 